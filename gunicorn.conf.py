@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for serving the web interface in production.
+
+Run with:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Threaded workers keep serving other requests while one waits on the LLM
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# GUNICORN_WORKER_CLASS=gevent swaps threads for greenlets (needs gevent installed)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Build the agent, engines and caches once in the master process and share
+# them with the workers through fork instead of once per worker
+preload_app = True
+
+def post_fork(server, worker):
+    """
+    Drop pooled connections inherited from the master (each worker opens its
+    own) and restart the log writer thread, which does not survive fork.
+    """
+    from sql_ai_web_interface import RO_ENGINE, start_log_listener
+    RO_ENGINE.dispose(close=False)
+    start_log_listener()
@@ -1,9 +1,8 @@
-import os
 import argparse
 import pandas as pd
 from sqlalchemy import create_engine, inspect, text
 from dotenv import load_dotenv
-from sqlai_agent import SQLAIAgent
+from sqlai_agent import SQLAIAgent, apply_sqlite_pragmas
 
 load_dotenv()
 
@@ -17,9 +16,29 @@ def display_results(results, format="table"):
     else:
         print(results)
 
+# Sample rows loaded by setup_sample_database
+SAMPLE_CUSTOMERS = [
+    (1, 'John Smith', 'john@example.com', 'USA', '2023-01-15'),
+    (2, 'Maria Garcia', 'maria@example.com', 'Spain', '2023-02-20'),
+    (3, 'Li Wei', 'li@example.com', 'China', '2023-03-10'),
+    (4, 'Aisha Khan', 'aisha@example.com', 'India', '2023-01-25'),
+    (5, 'Carlos Rodriguez', 'carlos@example.com', 'Mexico', '2023-04-05'),
+]
+
+SAMPLE_ORDERS = [
+    (101, 1, '2023-02-01', 150.75, 'Delivered'),
+    (102, 2, '2023-03-15', 89.99, 'Shipped'),
+    (103, 3, '2023-03-20', 245.50, 'Processing'),
+    (104, 1, '2023-04-10', 45.25, 'Delivered'),
+    (105, 4, '2023-04-12', 199.99, 'Shipped'),
+    (106, 5, '2023-04-15', 120.00, 'Processing'),
+    (107, 2, '2023-04-20', 65.50, 'Processing'),
+]
+
 def setup_sample_database(db_path):
     """Create a sample database for testing."""
     engine = create_engine(f"sqlite:///{db_path}")
+    apply_sqlite_pragmas(engine)
     
     # Create sample tables
     with engine.connect() as conn:
@@ -43,30 +62,28 @@ def setup_sample_database(db_path):
             FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
         )
         """))
-        
-        # Insert sample data
-        conn.execute(text("""
-        INSERT OR IGNORE INTO customers VALUES
-            (1, 'John Smith', 'john@example.com', 'USA', '2023-01-15'),
-            (2, 'Maria Garcia', 'maria@example.com', 'Spain', '2023-02-20'),
-            (3, 'Li Wei', 'li@example.com', 'China', '2023-03-10'),
-            (4, 'Aisha Khan', 'aisha@example.com', 'India', '2023-01-25'),
-            (5, 'Carlos Rodriguez', 'carlos@example.com', 'Mexico', '2023-04-05')
-        """))
-        
-        conn.execute(text("""
-        INSERT OR IGNORE INTO orders VALUES
-            (101, 1, '2023-02-01', 150.75, 'Delivered'),
-            (102, 2, '2023-03-15', 89.99, 'Shipped'),
-            (103, 3, '2023-03-20', 245.50, 'Processing'),
-            (104, 1, '2023-04-10', 45.25, 'Delivered'),
-            (105, 4, '2023-04-12', 199.99, 'Shipped'),
-            (106, 5, '2023-04-15', 120.00, 'Processing'),
-            (107, 2, '2023-04-20', 65.50, 'Processing')
-        """))
-        
         conn.commit()
     
+    # Insert sample data with one prepared statement per table, all in a
+    # single write transaction
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO customers VALUES (?, ?, ?, ?, ?)", SAMPLE_CUSTOMERS
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO orders VALUES (?, ?, ?, ?, ?)", SAMPLE_ORDERS
+        )
+        cursor.execute("COMMIT")
+        cursor.close()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+    
     return engine
 
 def main():
@@ -1,14 +1,58 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import os
 import re
+import atexit
+import base64
+import logging
+import queue
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from decimal import Decimal
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv
-import pandas as pd
-import json
-from sqlalchemy import text
-from sqlai_agent import SQLAIAgent
+import numpy as np
+import orjson
+import pyarrow as pa
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, OperationalError, ProgrammingError, SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from sqlglot.errors import ParseError, TokenError
+from sqlai_agent import (
+    SQLAIAgent, SQLITE_CACHED_STATEMENTS, UnsafeQueryError,
+    apply_sqlite_pragmas, check_read_only, fetch_dataframe, sqlglot_dialect
+)
+
+# Load environment variables from .env during development; production
+# deployments (FLASK_ENV=production) take them from the real environment
+if os.getenv("FLASK_ENV") != "production":
+    load_dotenv()
+
+# Log records are handed to a queue and written to stderr by a background
+# thread, so request threads never block on the stream
+_LOG_QUEUE = queue.SimpleQueue()
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[QueueHandler(_LOG_QUEUE)]
+)
+log = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+def start_log_listener():
+    """
+    Start the thread that drains the log queue. Threads do not survive
+    fork, so forked workers must call this again.
+    """
+    listener = QueueListener(_LOG_QUEUE, logging.StreamHandler())
+    listener.start()
+    atexit.register(listener.stop)
+
+start_log_listener()
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -17,46 +61,510 @@ app = Flask(__name__)
 DB_CONNECTION = os.getenv("DATABASE_URL", "sqlite:///example.db")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-# Initialize the SQL AI Agent
+# Optional hand-written or pre-generated schema text used in prompts in place
+# of reflecting the database
+SCHEMA_PROMPT_FILE = os.getenv("SCHEMA_PROMPT_FILE")
+SCHEMA_PROMPT = None
+if SCHEMA_PROMPT_FILE:
+    with open(SCHEMA_PROMPT_FILE) as f:
+        SCHEMA_PROMPT = f.read()
+
+def read_only_url(connection_string):
+    """
+    Return a read-only URL for a file-backed SQLite database, or None if
+    the database cannot be opened read-only (other backends, :memory:).
+    """
+    url = make_url(connection_string)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.set(
+        database=f"file:{url.database}",
+        query={**url.query, "mode": "ro", "uri": "true"}
+    )
+
+POOL_SIZE = max(4, os.cpu_count() or 1)
+RO_URL = read_only_url(DB_CONNECTION)
+
+# The app only ever reads: generated SQL runs on a single read pool, opened
+# read-only where the backend allows it
+if RO_URL is not None:
+    # Switch the database to WAL once, with a short-lived writable
+    # connection, so readers are never blocked by an outside writer
+    setup_engine = create_engine(DB_CONNECTION)
+    apply_sqlite_pragmas(setup_engine)
+    with setup_engine.connect():
+        pass
+    setup_engine.dispose()
+    
+    RO_ENGINE = create_engine(
+        RO_URL,
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_recycle=3600,
+        connect_args={"cached_statements": SQLITE_CACHED_STATEMENTS}
+    )
+    apply_sqlite_pragmas(RO_ENGINE, read_only=True)
+else:
+    RO_ENGINE = create_engine(
+        DB_CONNECTION,
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=3600
+    )
+
+# Initialize the SQL AI Agent on the read pool
+# Exact repeats are served by the response cache below, so the agent's own
+# result cache is only enabled for its semantic (paraphrase) matching
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE") == "1"
+
 agent = SQLAIAgent(
     db_connection_string=DB_CONNECTION,
     google_api_key=GOOGLE_API_KEY,
     model_name="gemini-2.0-flash",
-    verbose=True
+    verbose=True,
+    engine=RO_ENGINE,
+    prompt_schema_override=SCHEMA_PROMPT,
+    result_cache_size=1024 if SEMANTIC_CACHE else 0,
+    semantic_cache=SEMANTIC_CACHE
 )
 
+# Dialect used to check generated SQL before it runs
+SQL_DIALECT = sqlglot_dialect(RO_ENGINE.dialect.name)
+
+def run_sql(sql, dtype_backend=None):
+    """
+    Execute a SQL query on a pooled read connection and return a
+    DataFrame. Pass dtype_backend="pyarrow" for Arrow-backed columns.
+    All SQL run here comes from the model, so anything but a single
+    read-only query is refused with UnsafeQueryError before it reaches
+    the database.
+    """
+    check_read_only(sql, SQL_DIALECT)
+    with RO_ENGINE.connect() as conn:
+        return fetch_dataframe(conn, sql, dtype_backend)
+
+# Curly quotes the model sometimes emits, mapped to their ASCII forms
+_SMART_QUOTES = str.maketrans({
+    '\u201c': '"', '\u201d': '"',
+    '\u2018': "'", '\u2019': "'"
+})
+
 def clean_sql_query(query):
     """
     Clean up SQL query to fix common formatting issues.
     """
     if not query:
         return query
-        
+    
+    # Fast path for SQL that is already clean: no fences, no wrapping
+    # quotes, no "sql" prefix and nothing non-ASCII to translate or drop
+    query = query.strip()
+    if ('`' not in query and query.isascii()
+            and not query.startswith(('"', "'")) and query[:3].lower() != 'sql'):
+        return query
+    return _clean_sql_query(query)
+
+@functools.lru_cache(maxsize=1024)
+def _clean_sql_query(query):
+    """
+    Cached body of clean_sql_query; the same generated SQL is typically
+    cleaned many times per session.
+    """
+    # Every step below is a literal or anchored match, so plain string
+    # methods do each in one linear pass without a regex engine
+    
     # Remove any markdown formatting
-    query = re.sub(r'```(?:sql)?|```', '', query)
+    query = query.replace('```sql', '').replace('```', '')
     
-    # Remove quotes around the entire query
-    query = re.sub(r'^["\'](.*)["\']$', r'\1', query.strip())
+    # Remove quotes around the entire (single-line) query
+    query = query.strip()
+    if len(query) >= 2 and query[0] in '"\'' and query[-1] in '"\'' and '\n' not in query:
+        query = query[1:-1]
     
     # Remove any "sql" prefix that might appear
-    query = re.sub(r'^sql\s+', '', query, flags=re.IGNORECASE)
-    
-    # Replace smart quotes with standard quotes
-    query = query.replace('"', '"').replace('"', '"')
-    query = query.replace("'", "'").replace("'", "'")
+    if query[:3].lower() == 'sql' and query[3:4].isspace():
+        query = query[3:].lstrip()
     
-    # Remove any non-ASCII characters
-    query = ''.join(c for c in query if ord(c) < 128)
+    # Smart quotes and other non-ASCII characters are rare; str.isascii() is
+    # a flag check on the string object, so pure-ASCII SQL skips both passes
+    if not query.isascii():
+        # Replace smart quotes with standard quotes
+        query = query.translate(_SMART_QUOTES)
+        
+        # Remove any non-ASCII characters
+        query = query.encode('ascii', errors='ignore').decode('ascii')
     
     # Strip whitespace
     query = query.strip()
     
     return query
 
+# Generated SQL keyed by normalized question, so a repeated question skips
+# the LLM round-trip. Only SQL text is cached, never result data.
+SQL_CACHE_SIZE = 512
+_SQL_CACHE = OrderedDict()
+_SQL_CACHE_LOCK = threading.Lock()
+
+# Characters dropped from questions before cache lookups. Periods and
+# operators are kept since they can change a question's meaning ("1.5",
+# "> 100"); only a trailing period is stripped.
+_QUESTION_PUNCTUATION = str.maketrans('', '', '?!,;:"\'`')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Leading phrases that do not change what is being asked, so that
+# "Show me Q1 revenue" and "What was Q1 revenue?" share a cache entry
+_QUESTION_PREFIXES = (
+    "show me ", "give me ", "tell me ", "list ",
+    "what is ", "what was ", "what are ", "what were ",
+)
+
+def normalize_question(question):
+    """Normalize a question for cache lookups."""
+    question = question.lower().translate(_QUESTION_PUNCTUATION)
+    question = _WHITESPACE_RE.sub(' ', question).strip().rstrip('.')
+    for prefix in _QUESTION_PREFIXES:
+        if question.startswith(prefix):
+            return question[len(prefix):]
+    return question
+
+def get_cached_sql(key):
+    """Return the cached SQL for a normalized question, or None."""
+    with _SQL_CACHE_LOCK:
+        sql = _SQL_CACHE.get(key)
+        if sql is not None:
+            _SQL_CACHE.move_to_end(key)
+        return sql
+
+def cache_sql(key, sql):
+    """Remember the SQL for a normalized question, evicting the oldest entry."""
+    with _SQL_CACHE_LOCK:
+        _SQL_CACHE[key] = sql
+        _SQL_CACHE.move_to_end(key)
+        if len(_SQL_CACHE) > SQL_CACHE_SIZE:
+            _SQL_CACHE.popitem(last=False)
+
+def evict_cached_sql(key):
+    """Forget the SQL for a normalized question."""
+    with _SQL_CACHE_LOCK:
+        _SQL_CACHE.pop(key, None)
+
+# Whole responses (result dict plus DataFrame) for recently answered
+# questions, so a repeated question skips both the LLM and the database
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def response_cache_key(normalized_question):
+    """Return the response cache key for a normalized question."""
+    return hashlib.blake2b(normalized_question.encode(), digest_size=16).digest()
+
+def get_cached_response(key):
+    """Return the cached (result, DataFrame) pair for a key, or None."""
+    with _RESPONSE_CACHE_LOCK:
+        entry = _RESPONSE_CACHE.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= RESPONSE_CACHE_TTL:
+            del _RESPONSE_CACHE[key]
+            return None
+        _RESPONSE_CACHE.move_to_end(key)
+        return entry[1], entry[2]
+
+def cache_response(key, result, df):
+    """Remember a successful response, evicting the oldest entry."""
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = (time.monotonic(), result, df)
+        _RESPONSE_CACHE.move_to_end(key)
+        if len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
+
+# Agent calls in flight, keyed by normalized question, so concurrent
+# requests for the same question share one LLM round-trip
+_IN_FLIGHT = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+
+def process_question(question, cache_key):
+    """
+    Run agent.process_natural_language for `question`, joining an identical
+    call already in progress instead of starting another. Every caller gets
+    its own copy of the result dict.
+    """
+    with _IN_FLIGHT_LOCK:
+        future = _IN_FLIGHT.get(cache_key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _IN_FLIGHT[cache_key] = future
+    
+    if not leader:
+        return dict(future.result())
+    
+    try:
+        result = agent.process_natural_language(question)
+        future.set_result(result)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _IN_FLIGHT_LOCK:
+            del _IN_FLIGHT[cache_key]
+    return dict(result)
+
+# Errors raised when running generated SQL; driver errors arrive wrapped
+# in SQLAlchemy's DBAPIError, and SQL that fails the read-only check is
+# refused with UnsafeQueryError
+SQL_ERRORS = (SQLAlchemyError, UnsafeQueryError)
+
+def unwrap_db_error(error):
+    """Return the SQLAlchemy DBAPIError behind `error`, or None."""
+    while error is not None and not isinstance(error, DBAPIError):
+        error = error.__cause__
+    return error
+
+def db_error_message(error):
+    """
+    Return the database driver's own message for a failed query, without
+    the SQL echo and links that SQLAlchemy wraps around it.
+    """
+    db_error = unwrap_db_error(error)
+    return str(db_error.orig) if db_error is not None else str(error)
+
+def db_error_code(error):
+    """Return the driver's error code for a failed query, if it reports one."""
+    db_error = unwrap_db_error(error)
+    if db_error is None:
+        return None
+    orig = db_error.orig
+    # SQLite (Python 3.11+) and PostgreSQL expose named codes; MySQL
+    # drivers pass the numeric code as the first argument
+    code = getattr(orig, 'sqlite_errorname', None) or getattr(orig, 'pgcode', None)
+    if code is None and orig.args and isinstance(orig.args[0], int):
+        code = orig.args[0]
+    return code
+
+def is_syntax_error(error):
+    """Return True if a failed query was rejected as invalid SQL."""
+    if isinstance(error, UnsafeQueryError):
+        # SQL that does not parse is worth a repair; SQL that parses but
+        # writes is not
+        return isinstance(error.__cause__, (ParseError, TokenError))
+    db_error = unwrap_db_error(error)
+    if isinstance(db_error, ProgrammingError):
+        return True
+    # SQLite reports syntax errors as a generic OperationalError
+    return isinstance(db_error, OperationalError) and 'syntax error' in str(db_error.orig)
+
+@functools.lru_cache(maxsize=256)
+def repair_sql(sql, error):
+    """
+    Ask the agent to fix SQL that failed with `error`. Cached on the
+    (SQL, error) pair so the same failure is only sent to the LLM once.
+    """
+    fixed = agent.repair_query(sql, error)
+    return clean_sql_query(fixed) if fixed else None
+
+# Rows encoded per chunk when streaming a result table
+STREAM_CHUNK_ROWS = 1000
+
+# Clients asking for this type get the result table as an Arrow IPC stream
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Clients asking for this type get the result table as NDJSON row chunks
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _json_default(obj):
+    """Encode values orjson does not handle natively."""
+    # BLOB columns, as base64 text
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(obj).decode('ascii')
+    # NumPy scalars and arrays
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    # pandas Timestamps and other date-like values
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+# NumPy arrays are encoded natively, so frames can be passed as df.to_numpy();
+# non-string dict keys (e.g. integer or date group keys) are stringified
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+def _dumps(obj):
+    """Serialize to JSON bytes with orjson."""
+    return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that routes jsonify() and request.json through orjson."""
+    
+    def dumps(self, obj, **kwargs):
+        return _dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of decoding
+        # them to str and re-encoding as the default provider does
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(_dumps(obj), mimetype=self.mimetype)
+
+app.json = OrjsonProvider(app)
+
+# Bodies of the constant 400 responses for empty requests, encoded once.
+# A new Response is built per call since Flask may modify it in flight.
+_NO_QUERY_BODY = _dumps({"error": "No query provided"})
+_NO_QUERIES_BODY = _dumps({"error": "No queries provided"})
+
+def bad_request(body):
+    """Return a 400 response with a pre-encoded JSON body."""
+    return Response(body, status=400, mimetype='application/json')
+
+def normalize_nulls(df):
+    """
+    Return the frame with NaN/NaT/NA replaced by None, so every missing
+    value is encoded as JSON null (NaT would otherwise become "NaT").
+    Only columns that actually contain nulls are converted.
+    """
+    mask = df.isna()
+    null_columns = mask.any().to_numpy().nonzero()[0]
+    if len(null_columns) == 0:
+        return df
+    
+    df = df.copy()
+    for i in null_columns:
+        df.isetitem(i, df.iloc[:, i].astype(object).where(~mask.iloc[:, i], None))
+    return df
+
+def _df_to_table_data(df):
+    """
+    Build the table_data payload for a DataFrame. Rows are left as one
+    NumPy array, which orjson encodes without a per-row Python list.
+    """
+    df = normalize_nulls(df)
+    return {'columns': df.columns.tolist(), 'rows': df.to_numpy(), 'is_tabular': True}
+
+def _encode_row_chunks(df):
+    """
+    Yield the rows of a null-normalized DataFrame as comma-separated JSON
+    arrays, STREAM_CHUNK_ROWS rows per chunk.
+    """
+    # Null-free frames whose columns all share one numeric dtype can be
+    # encoded straight from NumPy (columns with nulls are object by now)
+    dtypes = set(df.dtypes)
+    if len(dtypes) == 1 and next(iter(dtypes)).kind in 'biuf':
+        # One C-contiguous block that orjson encodes chunk by chunk
+        # without creating a Python object per cell
+        values = np.ascontiguousarray(df.to_numpy())
+        for start in range(0, len(values), STREAM_CHUNK_ROWS):
+            yield _dumps(values[start:start + STREAM_CHUNK_ROWS])[1:-1]
+        return
+    
+    chunk = []
+    for row in df.itertuples(index=False, name=None):
+        chunk.append(_dumps(row))
+        if len(chunk) == STREAM_CHUNK_ROWS:
+            yield b','.join(chunk)
+            chunk = []
+    if chunk:
+        yield b','.join(chunk)
+
+def stream_table_response(result, df):
+    """
+    Stream `result` as JSON with the DataFrame attached as
+    result['table_data'], encoding rows chunk by chunk instead of
+    materializing the whole payload in memory first.
+    """
+    df = normalize_nulls(df)
+    
+    # Encode the head and first chunk before the response starts, so a value
+    # that cannot be encoded fails with an error status rather than a
+    # truncated 200 body
+    head = _dumps(result)
+    head = head[:-1] + (b',' if len(head) > 2 else b'')
+    head += b'"table_data":{"columns":' + _dumps(df.columns.tolist()) + b',"rows":['
+    chunks = _encode_row_chunks(df)
+    first = next(chunks, None)
+    
+    def generate():
+        yield head
+        if first is not None:
+            yield first
+            for chunk in chunks:
+                yield b',' + chunk
+        yield b'],"is_tabular":true}}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def ndjson_table_response(result, df):
+    """
+    Stream `result` as newline-delimited JSON: the first line is the result
+    with an empty result['table_data']['rows'], and every following line is
+    an array of up to STREAM_CHUNK_ROWS rows. Clients can render each line
+    as it arrives.
+    """
+    df = normalize_nulls(df)
+    
+    # As in stream_table_response, encode the head and first chunk up front
+    table_data = {'columns': df.columns.tolist(), 'rows': [], 'is_tabular': True}
+    head = _dumps({**result, 'table_data': table_data}) + b'\n'
+    chunks = _encode_row_chunks(df)
+    first = next(chunks, None)
+    
+    def generate():
+        yield head
+        if first is not None:
+            yield b'[' + first + b']\n'
+            for chunk in chunks:
+                yield b'[' + chunk + b']\n'
+    
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+def preferred_table_format():
+    """Return the result table mimetype the client prefers."""
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON_MIMETYPE, ARROW_STREAM_MIMETYPE]
+    )
+
+def arrow_table_response(result, df):
+    """
+    Return the DataFrame as an Arrow IPC stream. Columns are copied as
+    typed buffers with no per-cell Python objects; the rest of `result`
+    travels as JSON in the schema metadata.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), b'sqlai_result': _dumps(result)}
+    table = table.replace_schema_metadata(metadata)
+    
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM_MIMETYPE)
+
+def table_response(result, df):
+    """Return `result` with its result table in the format the client asked for."""
+    # Stream the table rather than building it into one JSON document
+    if df is not None:
+        table_format = preferred_table_format()
+        if table_format == ARROW_STREAM_MIMETYPE:
+            return arrow_table_response(result, df)
+        if table_format == NDJSON_MIMETYPE:
+            return ndjson_table_response(result, df)
+        return stream_table_response(result, df)
+    return jsonify(result)
+
 @app.route('/')
 def index():
     """Render the main application page."""
-    return render_template('index.html')
+    response = app.make_response(render_template('index.html'))
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response
 
 @app.route('/api/query', methods=['POST'])
 def process_query():
@@ -65,69 +573,228 @@ def process_query():
     query = data.get('query', '')
     
     if not query:
-        return jsonify({"error": "No query provided"}), 400
+        return bad_request(_NO_QUERY_BODY)
+    
+    # Answer repeated questions straight from the response cache
+    cache_key = normalize_question(query)
+    response_key = response_cache_key(cache_key)
+    cached = get_cached_response(response_key)
+    if cached:
+        result, df = cached
+        return table_response(dict(result, cached=True), df)
+    
+    # Reuse the SQL generated for an identical earlier question if we have it
+    cached_sql = get_cached_sql(cache_key)
+    if cached_sql:
+        result = {
+            "success": True,
+            "query": cached_sql,
+            "result": "Reused the SQL generated for an earlier identical question.",
+            "explanation": f"Processed query: {query}",
+            "cached": True
+        }
+    else:
+        # Process the query
+        result = process_question(query, cache_key)
     
-    # Process the query
-    result = agent.process_natural_language(query)
+    # The agent's DataFrame is not JSON serializable; take it out of the
+    # result and reuse it below if cleaning leaves the SQL unchanged
+    agent_df = result.pop('sql_result', None)
     
     # Extract SQL if it's not already present
-    if not result.get('query') and isinstance(result.get('result'), str):
-        extracted_sql = agent._extract_sql_from_response(result['result'])
-        if extracted_sql:
-            result['query'] = extracted_sql
-    
-    # Clean the SQL query if present
-    if result.get('query'):
-        original_query = result['query']
-        result['query'] = clean_sql_query(result['query'])
-        
-        # Try executing the cleaned query
+    raw_sql = result.get('query')
+    if not raw_sql:
+        text_result = result.get('result')
+        if isinstance(text_result, str):
+            raw_sql = agent._extract_sql_from_response(text_result)
+    
+    # Nothing to execute; return the agent's answer as is
+    if not raw_sql:
+        if result.get('success') and 'sql_error' not in result:
+            cache_response(response_key, result, None)
+        return jsonify(result)
+    
+    sql = clean_sql_query(raw_sql)
+    result['query'] = sql
+    
+    # Arrow clients get Arrow-backed columns, which become the IPC stream
+    # without another conversion
+    dtype_backend = 'pyarrow' if preferred_table_format() == ARROW_STREAM_MIMETYPE else None
+    
+    # Try executing the cleaned query
+    df = None
+    try:
+        if agent_df is not None and sql == raw_sql.strip():
+            df = agent_df
+        else:
+            df = run_sql(sql, dtype_backend)
+        # Clear any previous SQL errors if the query was successful
+        result.pop('sql_error', None)
+        cache_sql(cache_key, sql)
+    except SQL_ERRORS as e:
+        error_msg = db_error_message(e)
+        log.warning("SQL execution error: %s", error_msg)
+        evict_cached_sql(cache_key)
+        
+        # Give the model one chance to repair its own syntax errors
+        if is_syntax_error(e):
+            try:
+                fixed_query = repair_sql(sql, error_msg)
+            except Exception:
+                # The LLM call failed (quota, network, ...); keep the original error
+                log.exception("SQL repair request failed")
+                fixed_query = None
+            if fixed_query:
+                try:
+                    df = run_sql(fixed_query, dtype_backend)
+                    result['query'] = fixed_query  # Update with the successful query
+                    result['query_note'] = "Query was corrected after a syntax error."
+                    cache_sql(cache_key, fixed_query)
+                except SQL_ERRORS as repair_error:
+                    # If the repaired query also fails, keep the original error
+                    log.warning("SQL repair error: %s", db_error_message(repair_error))
+        
+        if df is None:
+            result['sql_error'] = error_msg
+            result['sql_error_code'] = db_error_code(e)
+    
+    if result.get('success') and 'sql_error' not in result:
+        cache_response(response_key, result, df)
+    
+    return table_response(result, df)
+
+# Upper bound on questions per batch request, to keep the prompt bounded
+BATCH_MAX_QUERIES = 20
+
+def _run_batch_item(question, sql):
+    """Execute the SQL generated for one question of a batch."""
+    result = {"question": question, "query": sql}
+    if not sql:
+        result["success"] = False
+        result["error"] = "No SQL query could be generated"
+        return result
+    
+    result["success"] = True
+    try:
+        result['table_data'] = _df_to_table_data(run_sql(sql))
+        cache_sql(normalize_question(question), sql)
+    except SQL_ERRORS as e:
+        result['sql_error'] = db_error_message(e)
+        result['sql_error_code'] = db_error_code(e)
+    return result
+
+@app.route('/api/query/batch', methods=['POST'])
+def process_query_batch():
+    """
+    Process several natural language queries with one LLM call and run the
+    resulting SQL concurrently. Results are returned in input order.
+    """
+    data = request.json
+    queries = data.get('queries', [])
+    
+    if not queries or not isinstance(queries, list) or not all(isinstance(q, str) and q for q in queries):
+        return bad_request(_NO_QUERIES_BODY)
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {BATCH_MAX_QUERIES} queries per batch"}), 400
+    
+    # Only send questions without cached SQL to the model
+    sql_queries = [get_cached_sql(normalize_question(q)) for q in queries]
+    pending = [i for i, sql in enumerate(sql_queries) if not sql]
+    if pending:
         try:
-            df = agent.run_query(result['query'])
-            # Convert to JSON-serializable format
-            result['table_data'] = {
-                'columns': df.columns.tolist(),
-                'rows': df.values.tolist(),
-                'is_tabular': True
-            }
-            # Clear any previous SQL errors if the query was successful
-            if 'sql_error' in result:
-                del result['sql_error']
+            generated = agent.generate_sql_batch([queries[i] for i in pending])
         except Exception as e:
-            error_msg = str(e)
-            print(f"SQL Execution Error: {error_msg}")
-            
-            # Try a fallback to direct SQL if the extracted query had issues
-            if 'syntax error' in error_msg.lower():
-                try:
-                    # Create a more direct SQL query based on the original
-                    fallback_query = f"SELECT city, COUNT(*) as count FROM customer GROUP BY city"
-                    df = agent.run_query(fallback_query)
-                    result['query'] = fallback_query  # Update with the successful query
-                    result['table_data'] = {
-                        'columns': df.columns.tolist(),
-                        'rows': df.values.tolist(),
-                        'is_tabular': True
-                    }
-                    # Add a note about the fallback
-                    result['query_note'] = "Query was adjusted for compatibility."
-                    # Clear any SQL errors since we recovered
-                    if 'sql_error' in result:
-                        del result['sql_error']
-                except Exception as fallback_error:
-                    # If fallback also fails, keep the original error
-                    result['sql_error'] = error_msg
-            else:
-                # For non-syntax errors, keep the original error
-                result['sql_error'] = error_msg
+            return jsonify({"success": False, "error": str(e)})
+        for i, sql in zip(pending, generated):
+            sql_queries[i] = clean_sql_query(sql)
+    
+    with ThreadPoolExecutor(max_workers=min(len(queries), POOL_SIZE)) as executor:
+        results = list(executor.map(_run_batch_item, queries, sql_queries))
+    
+    return jsonify({"success": True, "results": results})
+
+@app.route('/api/query/compound', methods=['POST'])
+def process_compound_query():
+    """
+    Process a compound question by splitting it into sub-questions whose
+    SQL runs in parallel; each sub-result carries its own table.
+    """
+    data = request.json
+    query = data.get('query', '')
+    
+    if not query:
+        return bad_request(_NO_QUERY_BODY)
+    
+    result = agent.process_compound_question(query)
+    
+    # Questions that did not split come back as a single result
+    df = result.pop('sql_result', None)
+    if df is not None:
+        result['table_data'] = _df_to_table_data(df)
+    for subresult in result.get('subresults', []):
+        df = subresult.pop('sql_result', None)
+        if df is not None:
+            subresult['table_data'] = _df_to_table_data(df)
     
     return jsonify(result)
 
+# Schema text, its ETag and the pre-serialized response body. Entries are
+# reused for SCHEMA_CACHE_TTL seconds so DDL changes are eventually picked
+# up without a restart; /api/schema/refresh drops the entry immediately.
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "300"))
+_SCHEMA_CACHE = {'ts': 0.0, 'val': None}
+_SCHEMA_LOCK = threading.Lock()
+
+def get_cached_schema():
+    """Return the cached schema entry, reloading it once the TTL expires."""
+    cached = _SCHEMA_CACHE['val']
+    if cached is not None and time.monotonic() - _SCHEMA_CACHE['ts'] < SCHEMA_CACHE_TTL:
+        return cached
+    
+    with _SCHEMA_LOCK:
+        # Another thread may have reloaded it while we waited
+        cached = _SCHEMA_CACHE['val']
+        if cached is not None and time.monotonic() - _SCHEMA_CACHE['ts'] < SCHEMA_CACHE_TTL:
+            return cached
+        
+        schema = agent.get_schema() if cached is None else agent.refresh_schema()
+        cached = {
+            'schema': schema,
+            'etag': hashlib.md5(schema.encode()).hexdigest(),
+            'body': _dumps({"schema": schema}),
+        }
+        _SCHEMA_CACHE['val'] = cached
+        _SCHEMA_CACHE['ts'] = time.monotonic()
+    return cached
+
+# Load the schema at startup (once in the gunicorn master with preload) so
+# neither the first request nor the LLM prompts pay for reflection
+get_cached_schema()
+
 @app.route('/api/schema', methods=['GET'])
 def get_schema():
     """Return the database schema."""
-    schema = agent.get_schema()
-    return jsonify({"schema": schema})
+    cached = get_cached_schema()
+    
+    # Let clients revalidate with If-None-Match instead of refetching
+    if request.if_none_match.contains(cached['etag']):
+        response = Response(status=304)
+    else:
+        response = Response(cached['body'], mimetype='application/json')
+    response.set_etag(cached['etag'])
+    return response
+
+@app.route('/api/schema/refresh', methods=['POST'])
+def refresh_schema():
+    """Reload the database schema, e.g. after DDL changes."""
+    with _SCHEMA_LOCK:
+        _SCHEMA_CACHE['val'] = None
+        agent.refresh_schema()
+    # Cached answers may no longer match the new schema
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE.clear()
+    cached = get_cached_schema()
+    return jsonify({"schema": cached['schema'], "etag": cached['etag']})
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze_query():
@@ -136,7 +803,7 @@ def analyze_query():
     query = data.get('query', '')
     
     if not query:
-        return jsonify({"error": "No query provided"}), 400
+        return bad_request(_NO_QUERY_BODY)
     
     # Clean the query before analysis
     query = clean_sql_query(query)
@@ -144,612 +811,10 @@ def analyze_query():
     analysis = agent.analyze_query(query)
     return jsonify(analysis)
 
-# Templates directory
-@app.route('/templates/<path:path>')
-def send_template(path):
-    """Serve template files."""
-    return app.send_static_file(f'templates/{path}')
-
-# Create templates directory if it doesn't exist
-os.makedirs('templates', exist_ok=True)
-
-# Write HTML template to separate file
-html_template = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>SQL AI Assistant</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/styles/atom-one-dark.min.css">
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/highlight.min.js"></script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/languages/sql.min.js"></script>
-    <style>
-        :root {
-            --primary-color: #4361ee;
-            --secondary-color: #3f37c9;
-            --accent-color: #4895ef;
-            --light-color: #f8f9fa;
-            --dark-color: #212529;
-            --success-color: #4cc9f0;
-            --warning-color: #f72585;
-            --info-color: #4361ee;
-            --header-bg: linear-gradient(135deg, #4361ee 0%, #3a0ca3 100%);
-            --card-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-            --hover-transition: all 0.3s ease;
-        }
-        
-        body {
-            background-color: #f5f7fb;
-            padding-top: 20px;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }
-        
-        .container {
-            max-width: 1200px;
-        }
-        
-        h1.page-title {
-            color: white;
-            font-weight: 700;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 25px;
-            background: var(--header-bg);
-            box-shadow: var(--card-shadow);
-            text-align: center;
-        }
-        
-        .card {
-            border: none;
-            border-radius: 10px;
-            box-shadow: var(--card-shadow);
-            transition: var(--hover-transition);
-            margin-bottom: 25px;
-            overflow: hidden;
-        }
-        
-        .card:hover {
-            box-shadow: 0 10px 15px rgba(0, 0, 0, 0.1);
-            transform: translateY(-5px);
-        }
-        
-        .card-header {
-            background: var(--header-bg);
-            color: white;
-            font-weight: 600;
-            padding: 15px 20px;
-            border-bottom: none;
-        }
-        
-        .card-header i {
-            margin-right: 10px;
-        }
-        
-        .card-body {
-            padding: 20px;
-            background-color: white;
-        }
-        
-        .input-group {
-            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.08);
-            border-radius: 8px;
-            overflow: hidden;
-        }
-        
-        .form-control {
-            border: 1px solid #e0e0e0;
-            padding: 12px 15px;
-            font-size: 16px;
-        }
-        
-        .form-control:focus {
-            box-shadow: none;
-            border-color: var(--primary-color);
-        }
-        
-        .btn-primary {
-            background-color: var(--primary-color);
-            border: none;
-            padding: 10px 25px;
-            font-weight: 600;
-            transition: var(--hover-transition);
-        }
-        
-        .btn-primary:hover {
-            background-color: var(--secondary-color);
-            transform: translateY(-2px);
-        }
-        
-        .result-area {
-            min-height: 200px;
-            border-radius: 4px;
-            word-wrap: break-word;
-        }
-        
-        .sql-query {
-            background-color: #282c34;
-            color: #abb2bf;
-            padding: 15px;
-            border-radius: 8px;
-            font-family: 'Consolas', 'Courier New', monospace;
-            position: relative;
-        }
-        
-        pre {
-            margin: 0;
-            white-space: pre-wrap;
-            font-size: 14px;
-            line-height: 1.5;
-        }
-        
-        code.language-sql {
-            color: #e06c75;
-        }
-        
-        .hljs-keyword {
-            color: #c678dd !important;
-            font-weight: bold;
-        }
-        
-        .hljs-built_in {
-            color: #56b6c2 !important;
-        }
-        
-        .hljs-type {
-            color: #98c379 !important;
-        }
-        
-        .hljs-literal {
-            color: #d19a66 !important;
-        }
-        
-        .hljs-number {
-            color: #d19a66 !important;
-        }
-        
-        .hljs-regexp {
-            color: #e06c75 !important;
-        }
-        
-        .hljs-string {
-            color: #98c379 !important;
-        }
-        
-        .hljs-subst {
-            color: #e6c07b !important;
-        }
-        
-        .hljs-symbol {
-            color: #61aeee !important;
-        }
-        
-        .hljs-class {
-            color: #e6c07b !important;
-        }
-        
-        .hljs-function {
-            color: #61aeee !important;
-        }
-        
-        .hljs-title {
-            color: #61aeee !important;
-        }
-        
-        .hljs-params {
-            color: #d19a66 !important;
-        }
-        
-        .table-responsive {
-            margin-top: 15px;
-            overflow-x: auto;
-        }
-        
-        .table-container {
-            margin-top: 15px;
-            max-height: 500px;
-            overflow-y: auto;
-            border: 1px solid #e0e0e0;
-            border-radius: 8px;
-            background-color: white;
-        }
-        
-        .results-table {
-            width: 100%;
-            border-collapse: separate;
-            border-spacing: 0;
-            margin-bottom: 0;
-        }
-        
-        .results-table th {
-            background: linear-gradient(135deg, #4361ee 0%, #3a0ca3 100%);
-            color: white;
-            padding: 15px 10px;
-            text-align: left;
-            position: sticky;
-            top: 0;
-            border: none;
-            font-weight: 600;
-        }
-        
-        .results-table th:first-child {
-            border-top-left-radius: 8px;
-        }
-        
-        .results-table th:last-child {
-            border-top-right-radius: 8px;
-        }
-        
-        .results-table td {
-            padding: 12px 10px;
-            border-bottom: 1px solid #e0e0e0;
-        }
-        
-        .results-table tr:nth-child(even) {
-            background-color: #f8f9fa;
-        }
-        
-        .results-table tr:hover {
-            background-color: #e8f4fd;
-        }
-        
-        .results-table tr:last-child td {
-            border-bottom: none;
-        }
-        
-        .results-table tr:last-child td:first-child {
-            border-bottom-left-radius: 8px;
-        }
-        
-        .results-table tr:last-child td:last-child {
-            border-bottom-right-radius: 8px;
-        }
-        
-        .sql-error {
-            background-color: #ffe8e8;
-            border-left: 4px solid #ff6b6b;
-            padding: 15px;
-            margin: 10px 0;
-            border-radius: 0 8px 8px 0;
-            color: #d63031;
-        }
-        
-        .debug-info {
-            margin-top: 20px;
-            font-size: 0.8em;
-            background-color: #f8f9fa;
-            padding: 10px;
-            border-radius: 8px;
-            border: 1px dashed #ced4da;
-        }
-        
-        .debug-info summary {
-            cursor: pointer;
-            padding: 8px;
-            color: #6c757d;
-            font-weight: 600;
-        }
-        
-        .debug-info pre {
-            background-color: #f1f3f5;
-            padding: 10px;
-            border-radius: 5px;
-            font-size: 12px;
-            color: #495057;
-        }
-        
-        .spinner-border {
-            color: var(--primary-color);
-        }
-        
-        .empty-state {
-            text-align: center;
-            padding: 40px 20px;
-            color: #6c757d;
-        }
-        
-        .empty-state i {
-            font-size: 48px;
-            margin-bottom: 15px;
-            color: #ced4da;
-        }
-        
-        .copy-btn {
-            position: absolute;
-            top: 10px;
-            right: 10px;
-            background-color: rgba(255, 255, 255, 0.2);
-            color: white;
-            border: none;
-            border-radius: 4px;
-            padding: 5px 10px;
-            font-size: 12px;
-            cursor: pointer;
-            transition: all 0.2s ease;
-        }
-        
-        .copy-btn:hover {
-            background-color: rgba(255, 255, 255, 0.3);
-        }
-        
-        @media (max-width: 768px) {
-            .container {
-                padding: 0 15px;
-            }
-            
-            h1.page-title {
-                font-size: 24px;
-                padding: 15px;
-            }
-            
-            .card-header {
-                padding: 12px 15px;
-            }
-            
-            .form-control {
-                padding: 10px;
-            }
-            
-            .btn-primary {
-                padding: 10px 15px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1 class="page-title"><i class="fas fa-database"></i> SQL AI Assistant</h1>
-        
-        <div class="row">
-            <div class="col-md-12">
-                <div class="card">
-                    <div class="card-header">
-                        <i class="fas fa-question-circle"></i> Ask a question about your database
-                    </div>
-                    <div class="card-body">
-                        <div class="input-group mb-3">
-                            <input type="text" id="queryInput" class="form-control" placeholder="e.g., How many customers do we have in each country?">
-                            <button class="btn btn-primary" type="button" id="submitBtn">
-                                <i class="fas fa-search me-2"></i>Submit
-                            </button>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="row">
-            <div class="col-md-6">
-                <div class="card">
-                    <div class="card-header">
-                        <i class="fas fa-code"></i> Generated SQL Query
-                    </div>
-                    <div class="card-body">
-                        <div class="sql-query result-area" id="sqlQueryContainer">
-                            <div id="sqlQuery">
-                                <!-- SQL query will appear here -->
-                                <div class="empty-state">
-                                    <i class="fas fa-code"></i>
-                                    <p>Your SQL query will appear here after submitting a question</p>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="col-md-6">
-                <div class="card">
-                    <div class="card-header">
-                        <i class="fas fa-info-circle"></i> Results Description
-                    </div>
-                    <div class="card-body">
-                        <div id="results" class="result-area">
-                            <!-- Text results will appear here -->
-                            <div class="empty-state">
-                                <i class="fas fa-comment-alt"></i>
-                                <p>The AI's explanation of your results will appear here</p>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="row">
-            <div class="col-md-12">
-                <div class="card">
-                    <div class="card-header">
-                        <i class="fas fa-table"></i> Data Table
-                    </div>
-                    <div class="card-body">
-                        <div id="sqlError" class="sql-error" style="display: none;">
-                            <!-- SQL error will appear here -->
-                        </div>
-                        <div class="table-container">
-                            <div id="tableResults" class="table-responsive">
-                                <!-- Table results will appear here -->
-                                <div class="empty-state">
-                                    <i class="fas fa-table"></i>
-                                    <p>Your query results will appear here in tabular format</p>
-                                </div>
-                            </div>
-                        </div>
-                        <div id="debugContainer">
-                            <!-- Debug info will appear here -->
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
-    
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/js/bootstrap.bundle.min.js"></script>
-    <script>
-        // Helper function to clean SQL query for display
-        function formatSqlForDisplay(sql) {
-            if (!sql) return '';
-            return sql;
-        }
-        
-        // Function to copy text to clipboard
-        function copyToClipboard(text) {
-            navigator.clipboard.writeText(text).then(() => {
-                const copyBtn = document.querySelector('.copy-btn');
-                copyBtn.innerHTML = '<i class="fas fa-check"></i> Copied!';
-                setTimeout(() => {
-                    copyBtn.innerHTML = '<i class="fas fa-copy"></i> Copy';
-                }, 2000);
-            });
-        }
-        
-        document.getElementById('submitBtn').addEventListener('click', async function() {
-            const query = document.getElementById('queryInput').value;
-            if (!query) return;
-            
-            // Clear previous results
-            document.getElementById('sqlQuery').innerHTML = '<div class="d-flex justify-content-center"><div class="spinner-border" role="status"><span class="visually-hidden">Loading...</span></div></div>';
-            document.getElementById('results').innerHTML = '<div class="d-flex justify-content-center"><div class="spinner-border" role="status"><span class="visually-hidden">Loading...</span></div></div>';
-            document.getElementById('tableResults').innerHTML = '<div class="d-flex justify-content-center"><div class="spinner-border" role="status"><span class="visually-hidden">Loading...</span></div></div>';
-            document.getElementById('sqlError').style.display = 'none';
-            document.getElementById('debugContainer').innerHTML = '';
-            
-            try {
-                // Send the query
-                const response = await fetch('/api/query', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ query }),
-                });
-                
-                const data = await response.json();
-                
-                // Display SQL query if available
-                if (data.query) {
-                    const formattedSql = formatSqlForDisplay(data.query);
-                    let queryHtml = `
-                        <button class="copy-btn" onclick="copyToClipboard(\`${formattedSql}\`)">
-                            <i class="fas fa-copy"></i> Copy
-                        </button>
-                        <pre><code class="language-sql">${formattedSql}</code></pre>
-                    `;
-                    
-                    // Add note about query adjustment if present
-                    if (data.query_note) {
-                        queryHtml += `<div class="alert alert-info mt-2 small">${data.query_note}</div>`;
-                    }
-                    
-                    document.getElementById('sqlQuery').innerHTML = queryHtml;
-                    
-                    // Apply syntax highlighting
-                    document.querySelectorAll('pre code').forEach((block) => {
-                        hljs.highlightBlock(block);
-                    });
-                } else {
-                    document.getElementById('sqlQuery').innerHTML = `
-                        <div class="empty-state">
-                            <i class="fas fa-exclamation-circle"></i>
-                            <p class="text-muted">No SQL query could be extracted from the response</p>
-                        </div>
-                    `;
-                }
-                
-                // Display text results in the Results Description section
-                if (data.success) {
-                    // Display text results in the top right panel
-                    document.getElementById('results').innerHTML = `<p>${data.result || "No text results available"}</p>`;
-                    
-                    // Check if we have tabular data to display
-                    if (data.table_data && data.table_data.is_tabular) {
-                        // If we have successful table data, hide any error message
-                        document.getElementById('sqlError').style.display = 'none';
-                    }
-                    // Otherwise, if we have a SQL error, show it
-                    else if (data.sql_error) {
-                        const errorElement = document.getElementById('sqlError');
-                        errorElement.innerHTML = `<i class="fas fa-exclamation-triangle me-2"></i><strong>SQL Execution Error:</strong> ${data.sql_error}`;
-                        errorElement.style.display = 'block';
-                    }
-                    
-                    // Now process the table data if available
-                    if (data.table_data && data.table_data.is_tabular) {
-                        // Create a table for the data
-                        let tableHTML = '<table class="results-table"><thead><tr>';
-                        
-                        // Add table headers
-                        data.table_data.columns.forEach(column => {
-                            tableHTML += `<th>${column}</th>`;
-                        });
-                        
-                        tableHTML += '</tr></thead><tbody>';
-                        
-                        // Add table rows
-                        data.table_data.rows.forEach(row => {
-                            tableHTML += '<tr>';
-                            row.forEach(cell => {
-                                // Handle null values and format the cell
-                                const cellValue = cell === null ? '<span class="text-muted">NULL</span>' : cell;
-                                tableHTML += `<td>${cellValue}</td>`;
-                            });
-                            tableHTML += '</tr>';
-                        });
-                        
-                        tableHTML += '</tbody></table>';
-                        
-                        document.getElementById('tableResults').innerHTML = tableHTML;
-                    } else if (!data.sql_error) {
-                        // No table and no error means we should indicate no tabular data
-                        document.getElementById('tableResults').innerHTML = `
-                            <div class="empty-state">
-                                <i class="fas fa-info-circle"></i>
-                                <p class="text-muted">No tabular data available for this query</p>
-                            </div>
-                        `;
-                    }
-                    
-                    // Add debug info
-                    const debugSection = document.createElement('details');
-                    debugSection.className = 'debug-info';
-                    debugSection.innerHTML = `
-                        <summary><i class="fas fa-bug me-1"></i> Debug Info</summary>
-                        <pre>${JSON.stringify(data, null, 2)}</pre>
-                    `;
-                    document.getElementById('debugContainer').appendChild(debugSection);
-                } else {
-                    document.getElementById('results').innerHTML = `<div class="alert alert-danger"><i class="fas fa-exclamation-circle me-2"></i>Error: ${data.error}</div>`;
-                    document.getElementById('tableResults').innerHTML = `
-                        <div class="empty-state">
-                            <i class="fas fa-exclamation-triangle"></i>
-                            <p class="text-muted">No data available due to an error</p>
-                        </div>
-                    `;
-                }
-            } catch (error) {
-                console.error('Error:', error);
-                document.getElementById('sqlQuery').innerHTML = '';
-                document.getElementById('results').innerHTML = `<div class="alert alert-danger"><i class="fas fa-exclamation-circle me-2"></i>Error connecting to server: ${error.message}</div>`;
-                document.getElementById('tableResults').innerHTML = '';
-            }
-        });
-        
-        // Allow pressing Enter to submit
-        document.getElementById('queryInput').addEventListener('keypress', function(e) {
-            if (e.key === 'Enter') {
-                document.getElementById('submitBtn').click();
-            }
-        });
-    </script>
-</body>
-</html>"""
-
-# Create index.html file with the template
-with open('templates/index.html', 'w') as f:
-    f.write(html_template)
-
 if __name__ == '__main__':
-    # Run the Flask app
+    # Run the Flask development server; use gunicorn (see wsgi.py) in production.
+    # The reloader stays off: it re-imports this module in a child process,
+    # building a second agent and LLM client.
     port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    app.run(host='0.0.0.0', port=port, debug=debug, use_reloader=False)
\ No newline at end of file
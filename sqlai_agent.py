@@ -1,18 +1,415 @@
 import os
-from typing import List, Dict, Any, Optional
+import io
+import asyncio
+import re
+import json
+import time
+import hashlib
+import functools
+import itertools
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlencode
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+import sqlglot
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.agents.agent_toolkits import create_sql_agent
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_community.utilities import SQLDatabase
 from langchain.agents import AgentExecutor
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 
-# Load environment variables
-load_dotenv()
+# Optional ADBC drivers: when installed, run_query fetches results as Arrow
+# tables straight from the database instead of row tuples through the DBAPI
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+try:
+    import adbc_driver_postgresql.dbapi as adbc_postgresql
+except ImportError:
+    adbc_postgresql = None
+
+# PRAGMAs applied to every new SQLite connection: WAL lets readers run
+# alongside the single writer, synchronous=NORMAL skips the per-commit
+# fsync that WAL makes unnecessary for durability of the database file,
+# and mmap_size serves page reads from a memory map instead of a pread()
+# syscall per page
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Size of sqlite3's per-connection cache of prepared statements, keyed by
+# SQL text (the module default is 128). Repeated SQL, such as a dashboard
+# re-running the same generated query, skips parsing and planning.
+SQLITE_CACHED_STATEMENTS = 512
+
+def is_sqlite(connection_string) -> bool:
+    """Return True if the connection string points at SQLite."""
+    return make_url(connection_string).get_backend_name() == "sqlite"
+
+def apply_sqlite_pragmas(engine: Engine, read_only: bool = False) -> None:
+    """
+    Run SQLITE_PRAGMAS on every connection the engine opens.
+    
+    Args:
+        engine: SQLite engine to configure
+        read_only: Skip journal_mode, which read-only connections cannot change
+    """
+    pragmas = SQLITE_PRAGMAS if read_only else ("PRAGMA journal_mode=WAL",) + SQLITE_PRAGMAS
+    
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _connection_record):
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+def fetch_dataframe(conn: Connection, query: str,
+                    dtype_backend: Optional[str] = None) -> pd.DataFrame:
+    """
+    Run a raw SQL string on an open connection and return the rows as a
+    DataFrame. The string goes straight to the DBAPI cursor, so SQLAlchemy
+    neither compiles it nor scans it for bind parameters (a literal '%' or
+    ':name' in generated SQL is left alone).
+    
+    Args:
+        conn: Open SQLAlchemy connection
+        query: SQL query to execute
+        dtype_backend: "pyarrow" for Arrow-backed columns, as in pd.read_sql
+        
+    Returns:
+        DataFrame with query results
+    """
+    result = conn.execution_options(no_parameters=True).exec_driver_sql(query)
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    if dtype_backend is not None:
+        df = df.convert_dtypes(dtype_backend=dtype_backend)
+    return df
+
+def schema_digest(schema: str) -> str:
+    """Return a short digest identifying a version of the schema text."""
+    return hashlib.blake2b(schema.encode(), digest_size=16).hexdigest()
+
+# With verbose on, run_query prints the connection pool status every this
+# many queries, to show whether the pool is over- or under-provisioned
+POOL_STATUS_INTERVAL = 100
+
+# Threads arun_query runs queries on when the engine's pool does not bound
+# the number of connections
+DEFAULT_DB_WORKERS = 8
+
+def pool_capacity(engine: Engine) -> Optional[int]:
+    """
+    Return the most connections the engine's pool will open at once, or
+    None if the pool does not bound them (unlimited overflow, or a pool
+    class other than QueuePool).
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+# Suggested schema_cache_dir: where get_schema can keep schema text between
+# processes, one file per DDL fingerprint
+SCHEMA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".sqlai_cache")
+
+# One catalog query per backend whose rows change whenever a table, column,
+# index or view is created, altered or dropped
+DDL_FINGERPRINT_QUERIES = {
+    "sqlite": "SELECT type, name, tbl_name, sql FROM sqlite_master ORDER BY type, name",
+    "postgresql": (
+        "SELECT c.relname, c.relkind, a.attnum, a.attname, "
+        "format_type(a.atttypid, a.atttypmod), a.attnotnull "
+        "FROM pg_catalog.pg_class c "
+        "JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid "
+        "WHERE c.relnamespace = current_schema()::regnamespace "
+        "AND a.attnum > 0 AND NOT a.attisdropped "
+        "ORDER BY c.relname, a.attnum"
+    ),
+}
+
+def ddl_fingerprint(engine: Engine) -> Optional[str]:
+    """
+    Return a digest of the database's DDL, read with a single catalog query,
+    or None if the backend has no fingerprint query (or it fails).
+    
+    Args:
+        engine: Engine for the database
+        
+    Returns:
+        Hex digest that changes whenever the schema does
+    """
+    query = DDL_FINGERPRINT_QUERIES.get(engine.url.get_backend_name())
+    if query is None or is_memory_sqlite(engine.url):
+        return None
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(query).fetchall()
+    except SQLAlchemyError:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(engine.url.render_as_string(hide_password=True).encode())
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()
+
+def adbc_connector(url) -> Optional[Callable[[], Any]]:
+    """
+    Return a function that opens an ADBC connection to the database at a
+    SQLAlchemy URL, or None if no ADBC driver is installed for its backend.
+    In-memory SQLite is excluded since a new connection would see a
+    different, empty database.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite" and adbc_sqlite is not None:
+        if is_memory_sqlite(url):
+            return None
+        database = url.database
+        params = {key: value for key, value in url.query.items() if key != "uri"}
+        if url.query.get("uri") == "true" and params:
+            # Rebuild SQLite URI filenames such as file:...?mode=ro
+            database += "?" + urlencode(params)
+        return lambda: adbc_sqlite.connect(database, autocommit=True)
+    if backend == "postgresql" and adbc_postgresql is not None:
+        uri = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        return lambda: adbc_postgresql.connect(uri, autocommit=True)
+    return None
+
+def is_memory_sqlite(connection_string: str) -> bool:
+    """Return True for in-memory SQLite URLs, which cannot use a QueuePool."""
+    if not is_sqlite(connection_string):
+        return False
+    url = make_url(connection_string)
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+# SQLAlchemy dialect names that sqlglot spells differently
+SQLGLOT_DIALECTS = {"postgresql": "postgres", "mssql": "tsql", "mariadb": "mysql"}
+
+# Expressions that write data or change the schema; generated SQL containing
+# any of them, even inside a CTE, is refused
+_WRITE_EXPRESSIONS = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Into,
+    exp.Create, exp.Drop, exp.Alter, exp.TruncateTable, exp.Command,
+)
+
+class UnsafeQueryError(ValueError):
+    """Raised for generated SQL that is not a single read-only query."""
+
+def sqlglot_dialect(dialect_name: str) -> Optional[str]:
+    """Return sqlglot's name for a SQLAlchemy dialect, or None if it has none."""
+    name = SQLGLOT_DIALECTS.get(dialect_name, dialect_name)
+    return name if name in Dialect.classes else None
+
+@functools.lru_cache(maxsize=256)
+def check_read_only(sql: str, dialect: Optional[str] = None) -> exp.Expression:
+    """
+    Parse SQL with sqlglot and make sure it is a single read-only query.
+    Results are cached, so SQL that is generated again is not re-parsed.
+    
+    Args:
+        sql: SQL to check
+        dialect: sqlglot dialect to parse with (generic SQL if None)
+        
+    Returns:
+        The parsed query
+        
+    Raises:
+        UnsafeQueryError: If the SQL cannot be parsed, holds several
+            statements, or is not a query that only reads
+    """
+    try:
+        statements = [tree for tree in sqlglot.parse(sql, read=dialect) if tree is not None]
+    except sqlglot.errors.SqlglotError as e:
+        # ParseError, or TokenError for e.g. an unterminated string literal
+        raise UnsafeQueryError(f"Could not parse SQL: {e}") from e
+    if len(statements) != 1:
+        raise UnsafeQueryError(f"Expected a single SQL statement, got {len(statements)}")
+    tree = statements[0]
+    if not isinstance(tree, exp.Query) or tree.find(*_WRITE_EXPRESSIONS):
+        raise UnsafeQueryError(f"Only read-only SELECT queries may be run, got: {sql}")
+    return tree
+
+# A complete ```sql fenced block in model output
+_SQL_FENCE_RE = re.compile(r"```sql\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+# SQL in a finished response: a ```sql block (possibly left unclosed), or
+# else a bare SELECT statement up to its semicolon or the end of the text
+_SQL_BLOCK_RE = re.compile(r"```sql\s*(.*?)(?:```|\Z)", re.DOTALL | re.IGNORECASE)
+_SELECT_RE = re.compile(r"\bSELECT\b.*?(?:;|\Z)", re.DOTALL | re.IGNORECASE)
+
+class SQLFenceWatcher(BaseCallbackHandler):
+    """
+    Callback handler that watches streamed LLM tokens and reports the SQL
+    in a ```sql fenced block as soon as the fence closes, rather than after
+    the whole answer has been generated.
+    """
+    
+    # Called directly on every token, also from async runs, instead of being
+    # handed off to a worker thread per token
+    run_inline = True
+    
+    def __init__(self, on_sql: Callable[[str], None]):
+        self.on_sql = on_sql
+        self._reset()
+    
+    def _reset(self) -> None:
+        self._buffer = ""
+        self._scan_pos = 0
+    
+    def on_llm_start(self, *args: Any, **kwargs: Any) -> None:
+        self._reset()
+    
+    def on_chat_model_start(self, *args: Any, **kwargs: Any) -> None:
+        self._reset()
+    
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._buffer += token
+        match = _SQL_FENCE_RE.search(self._buffer, self._scan_pos)
+        if match:
+            self._scan_pos = match.end()
+            sql = match.group(1).strip()
+            if sql:
+                self.on_sql(sql)
+            return
+        # Resume from an unclosed fence, or from the last two characters
+        # (a fence split across tokens), so earlier text is not rescanned
+        fence = self._buffer.find("```", self._scan_pos)
+        self._scan_pos = fence if fence >= 0 else max(self._scan_pos, len(self._buffer) - 2)
+
+class AgentQueries:
+    """
+    Tracks the SQL issued during one agent run and starts each query on an
+    executor as soon as it is known. SQL the agent runs through the
+    sql_db_query tool takes precedence over SQL it only writes in a ```sql
+    block, and a newer query cancels an older one that has not started yet.
+    """
+    
+    def __init__(self, executor: ThreadPoolExecutor, run_query: Callable[[str], pd.DataFrame]):
+        self.executor = executor
+        self.run_query = run_query
+        self.sql_query = None
+        self.pending = None
+        self.ran_tool_query = False
+        self.watcher = SQLFenceWatcher(self.on_fenced_sql)
+    
+    def start(self, sql: str) -> None:
+        """Start running `sql` unless it is already the current query."""
+        if sql == self.sql_query:
+            return
+        if self.pending is not None:
+            self.pending.cancel()
+        self.sql_query = sql
+        self.pending = self.executor.submit(self.run_query, sql)
+    
+    def on_fenced_sql(self, sql: str) -> None:
+        if not self.ran_tool_query:
+            self.start(sql)
+    
+    def on_chunk(self, chunk: Dict[str, Any], response: str) -> str:
+        """
+        Handle one chunk of agent output; returns the final answer so far.
+        """
+        for action in chunk.get("actions", []):
+            if action.tool != "sql_db_query":
+                continue
+            tool_input = action.tool_input
+            if isinstance(tool_input, dict):
+                tool_input = tool_input.get("query", "")
+            if not tool_input:
+                continue
+            self.ran_tool_query = True
+            self.start(tool_input.strip())
+        return chunk.get("output", response)
+
+# Prompts grounded in the schema all open with the same schema block and put
+# the per-request values last, so consecutive calls share the longest
+# possible token prefix and the model backend can reuse its cached prefix
+SCHEMA_PREFIX = """Database schema:
+{schema}
+
+"""
+
+SQL_EXTRACTION_TEMPLATE = SCHEMA_PREFIX + """Based on the database schema above and the natural language query,
+generate an SQL query that would answer the question.
+
+Previous analysis: {response}
+
+Question: {question}
+
+SQL Query (include only the SQL, no explanations):
+"""
+
+SQL_REPAIR_TEMPLATE = SCHEMA_PREFIX + """The SQL query below failed when run against a database with the schema above.
+
+Query: {query}
+
+Error: {error}
+
+Corrected SQL Query (include only the SQL, no explanations):
+"""
+
+SQL_BATCH_TEMPLATE = SCHEMA_PREFIX + """Based on the database schema above, write one SQL query answering
+each of the numbered questions. Respond with only a JSON array of {count}
+strings, where each string is the SQL query for the question with the
+same number.
+
+Questions:
+{questions}
+"""
+
+DECOMPOSE_TEMPLATE = SCHEMA_PREFIX + """Based on the database schema above, decide whether the question asks
+for several independent results that are better answered by separate
+SQL queries. If it does, split it into at most {max_parts} self-contained
+questions. Otherwise use the question unchanged as the only item.
+Respond with only a JSON array of strings.
+
+Question: {question}
+"""
+
+# Fixed instructions first and the query last, so every analysis request
+# shares the same prompt prefix
+ANALYZE_TEMPLATE = """Analyze the SQL query below concisely (max 3-4 bullet points).
+
+Provide only:
+• Safety (any risks?)
+• Performance (any optimizations?)
+• Correctness (any logical issues?)
+
+Keep each point to 1-2 sentences maximum.
+
+SQL query:
+{query}
+"""
+
+SUMMARIZE_TEMPLATE = """Answer the question below using the results of its sub-questions.
+Answer concisely, comparing the results where the question asks for it.
+
+Question: {question}
+
+Sub-question results:
+{results}
+"""
 
 class SQLAIAgent:
     """
@@ -26,7 +423,22 @@ class SQLAIAgent:
         google_api_key: Optional[str] = None,
         model_name: str = "gemini-2.0-flash",
         temperature: float = 0.0,
-        verbose: bool = False
+        verbose: bool = False,
+        engine: Optional[Engine] = None,
+        prompt_schema_override: Optional[str] = None,
+        result_cache_size: int = 1024,
+        result_cache_ttl: float = 3600.0,
+        semantic_cache: bool = False,
+        semantic_threshold: float = 0.92,
+        embedding_model: str = "models/text-embedding-004",
+        schema_cache_dir: Optional[str] = None,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_pre_ping: bool = True,
+        pool_recycle: int = 1800,
+        schema_top_k: int = 8,
+        max_iterations: int = 5,
+        top_k: int = 10
     ):
         """
         Initialize the SQL AI Agent.
@@ -37,112 +449,665 @@ class SQLAIAgent:
             model_name: LLM model to use (Gemini 2.0 Flash by default)
             temperature: Creativity of the model (0.0 = deterministic)
             verbose: Whether to print debug information
+            engine: Pre-built SQLAlchemy engine to share (e.g. a pooled engine
+                owned by the web app); built from db_connection_string if omitted
+            prompt_schema_override: Precomputed schema text to use in prompts
+                instead of reflecting the database
+            result_cache_size: Number of answered questions to remember
+                (0 disables the result cache)
+            result_cache_ttl: Seconds a remembered answer stays valid
+            semantic_cache: Also reuse answers to paraphrased questions,
+                matched by embedding similarity (one embedding call per miss)
+            semantic_threshold: Minimum cosine similarity for a semantic hit
+            embedding_model: Embedding model used by the semantic cache
+            schema_cache_dir: Directory where schema text is saved, keyed by
+                a fingerprint of the database's DDL, so other processes can
+                skip introspection (e.g. SCHEMA_CACHE_DIR; None disables).
+                The text includes a few sample rows from each table.
+            pool_size: Connections kept open in the engine's pool
+            max_overflow: Extra connections opened under load
+            pool_pre_ping: Test pooled connections before use, replacing
+                ones the server has closed
+            pool_recycle: Seconds after which a pooled connection is replaced
+            schema_top_k: Number of tables, picked by embedding similarity
+                to the question, whose schema goes into the fallback SQL
+                extraction prompt (0 sends the whole schema)
+            max_iterations: Maximum number of agent steps (tool-call rounds)
+                before the agent is stopped
+            top_k: Row limit the agent is told to apply to its queries, which
+                also bounds the rows fed back to the model; call run_query
+                with your own LIMIT for full results
         """
         # Set API key
         if google_api_key:
             os.environ["GOOGLE_API_KEY"] = google_api_key
         
-        # Initialize database connection
-        self.db = SQLDatabase.from_uri(db_connection_string)
-        self.engine = create_engine(db_connection_string)
-        
-        # Initialize LLM with Google Gemini
-        self.llm = ChatGoogleGenerativeAI(
-            temperature=temperature,
-            model=model_name,
-            verbose=verbose
-        )
+        # Initialize database connection, reusing the caller's engine if given
+        if engine is None:
+            # In-memory SQLite keeps its default single-connection pool
+            pool_args = {} if is_memory_sqlite(db_connection_string) else {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "pool_pre_ping": pool_pre_ping,
+                "pool_recycle": pool_recycle
+            }
+            if is_sqlite(db_connection_string):
+                pool_args["connect_args"] = {"cached_statements": SQLITE_CACHED_STATEMENTS}
+            engine = create_engine(db_connection_string, **pool_args)
+            if is_sqlite(db_connection_string):
+                apply_sqlite_pragmas(engine)
+        self.engine = engine
+        self.db = SQLDatabase(self.engine)
         
-        # Create SQL toolkit and agent
-        self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
-        self.agent_executor = create_sql_agent(
-            llm=self.llm,
-            toolkit=self.toolkit,
-            verbose=verbose,
-            top_k=100  # Return more examples for better context
-        )
+        # The Gemini LLM, toolkit and agent are built on first use (see the
+        # llm and agent_executor properties). The LLM client opens gRPC
+        # channels, which do not survive fork, so an agent preloaded in a
+        # server's master process must not create them before the workers fork.
+        self._llm_args = {
+            "temperature": temperature,
+            "model": model_name,
+            "verbose": verbose,
+            "streaming": True,  # token callbacks let SQL start before the answer is complete
+            "max_retries": 2
+        }
+        self._llm = None
+        self.toolkit = None
+        self._agent_executor = None
+        self._max_iterations = max_iterations
+        self._top_k = top_k
+        self._init_lock = threading.Lock()
         
-        # Schema caching
+        # Schema caching; the version is a fingerprint of the DDL (or a
+        # digest of the schema text), so cached answers are never reused
+        # across schema changes
         self._schema_cache = None
+        self._schema_cache_dir = schema_cache_dir
+        self._schema_override = prompt_schema_override
+        self._schema_version = None
+        if prompt_schema_override is not None:
+            self._schema_version = schema_digest(prompt_schema_override)
+        
+        # Answers to earlier questions, keyed by question and schema version.
+        # Entries hold the result without its DataFrame plus the DataFrame as
+        # Parquet bytes. With semantic_cache, the questions' normalized
+        # float32 embeddings are rows of one contiguous matrix
+        # (allocated for result_cache_size rows on first use) so a lookup
+        # scores every entry with a single matrix-vector product;
+        # _emb_keys[i] is the cache key for row i.
+        self._result_cache = OrderedDict()
+        self._emb_matrix = None
+        self._emb_keys = []
+        self._emb_rows = {}
+        self._result_cache_lock = threading.Lock()
+        self._result_cache_size = result_cache_size
+        self._result_cache_ttl = result_cache_ttl
+        self._semantic_cache = semantic_cache
+        self._semantic_threshold = semantic_threshold
+        self._embedding_model = embedding_model
+        self._embeddings = None
+        
+        # Normalized embeddings of each table's name and columns, used to
+        # pick the tables relevant to a question, and the schema text of each
+        # table picked so far; both built on first use and tied to the
+        # schema version they were built for
+        self._schema_top_k = schema_top_k
+        self._table_embeddings = None
+        self._table_info = (None, {})
+        
+        # LLMChains for the module-level prompt templates, built on first use
+        self._chains = {}
+        
+        # Runs the agent's SQL in the background while it writes its answer
+        self._executor = ThreadPoolExecutor(max_workers=4)
+        
+        # Runs arun_query's blocking database calls off the event loop, apart
+        # from the agent's pool so a burst of async queries cannot starve it.
+        # The semaphores keep async callers from queueing more queries than
+        # the engine's pool (which may be the caller's) has connections;
+        # asyncio semaphores belong to one event loop, so there is one per
+        # loop. The count drives the periodic pool status log.
+        self._max_connections = pool_capacity(self.engine) or DEFAULT_DB_WORKERS
+        self._db_pool = ThreadPoolExecutor(max_workers=self._max_connections, thread_name_prefix="sqlai-db")
+        self._conn_semaphores = weakref.WeakKeyDictionary()
+        self._query_count = itertools.count(1)
+        
+        # ADBC connections are not thread-safe, so each thread opens its own
+        self._adbc_connect = adbc_connector(self.engine.url)
+        self._adbc_local = threading.local()
+        
+        # Dialect used to parse generated SQL before it runs
+        self._sqlglot_dialect = sqlglot_dialect(self.engine.dialect.name)
         
         # Verbose flag
         self.verbose = verbose
     
+    @property
+    def llm(self) -> ChatGoogleGenerativeAI:
+        """The Gemini chat model, created on first access."""
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    self._llm = ChatGoogleGenerativeAI(**self._llm_args)
+        return self._llm
+    
+    @property
+    def agent_executor(self) -> AgentExecutor:
+        """The LangChain SQL agent, created on first access."""
+        if self._agent_executor is None:
+            llm = self.llm
+            with self._init_lock:
+                if self._agent_executor is None:
+                    # Create SQL toolkit and agent. A tool-calling agent passes
+                    # SQL as structured tool arguments (read by AgentQueries)
+                    # instead of writing a Thought/Action/Observation
+                    # scratchpad that is fed back into every step's prompt.
+                    self.toolkit = SQLDatabaseToolkit(db=self.db, llm=llm)
+                    self._agent_executor = create_sql_agent(
+                        llm=llm,
+                        toolkit=self.toolkit,
+                        agent_type="tool-calling",
+                        max_iterations=self._max_iterations,
+                        verbose=self._llm_args["verbose"],
+                        top_k=self._top_k
+                    )
+        return self._agent_executor
+    
+    @property
+    def embeddings(self) -> GoogleGenerativeAIEmbeddings:
+        """The embedding model for the semantic cache, created on first access."""
+        if self._embeddings is None:
+            with self._init_lock:
+                if self._embeddings is None:
+                    self._embeddings = GoogleGenerativeAIEmbeddings(model=self._embedding_model)
+        return self._embeddings
+    
+    def _chain(self, template: str) -> LLMChain:
+        """
+        Return the LLMChain for a prompt template, building it on first use.
+        """
+        chain = self._chains.get(template)
+        if chain is None:
+            prompt = PromptTemplate.from_template(template)
+            chain = self._chains.setdefault(template, LLMChain(llm=self.llm, prompt=prompt))
+        return chain
+    
     def get_schema(self) -> str:
         """
         Get the database schema as a string.
         """
+        if self._schema_override is not None:
+            return self._schema_override
         if self._schema_cache is None:
-            self._schema_cache = self.db.get_table_info()
+            self._load_schema(use_saved=True)
         return self._schema_cache
     
-    def run_query(self, query: str) -> pd.DataFrame:
+    def _load_schema(self, use_saved: bool) -> str:
+        """
+        Read the schema, from the file saved for the current DDL fingerprint
+        if use_saved is set and there is one, else from the database (saving
+        it when schema_cache_dir is set).
+        """
+        fingerprint = ddl_fingerprint(self.engine) if self._schema_cache_dir else None
+        schema = self._load_schema_file(fingerprint) if fingerprint and use_saved else None
+        if schema is None:
+            schema = self.db.get_table_info()
+            if fingerprint:
+                self._save_schema_file(fingerprint, schema)
+        self._schema_version = fingerprint or schema_digest(schema)
+        self._schema_cache = schema
+        return schema
+    
+    def _schema_file(self, fingerprint: str) -> str:
+        """Path of the saved schema text for a DDL fingerprint."""
+        return os.path.join(self._schema_cache_dir, f"schema_{fingerprint}.txt")
+    
+    def _load_schema_file(self, fingerprint: str) -> Optional[str]:
+        """Read the schema text saved for a DDL fingerprint, if any."""
+        try:
+            with open(self._schema_file(fingerprint), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _save_schema_file(self, fingerprint: str, schema: str) -> None:
+        """
+        Save schema text for a DDL fingerprint. The file is written under a
+        temporary name and renamed into place, so concurrent readers never
+        see a partial file.
+        """
+        try:
+            os.makedirs(self._schema_cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._schema_cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(schema)
+                os.replace(tmp_path, self._schema_file(fingerprint))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            if self.verbose:
+                print(f"Could not save schema cache: {e}")
+    
+    def refresh_schema(self) -> str:
+        """
+        Drop the cached schema and read it again from the database,
+        replacing the saved copy (and its sample rows) if schema_cache_dir
+        is set. SQLDatabase fixes its table list when it is created, so it
+        is rebuilt, along with the toolkit and agent that use it, to pick
+        up tables created or dropped since.
+        """
+        with self._init_lock:
+            self.db = SQLDatabase(self.engine)
+            self.toolkit = None
+            self._agent_executor = None
+            self._table_embeddings = None
+            self._table_info = (None, {})
+        if self._schema_override is not None:
+            return self._schema_override
+        self._schema_cache = None
+        return self._load_schema(use_saved=False)
+    
+    def relevant_schema(self, question: str) -> str:
+        """
+        Get the schema of only the tables most relevant to a question, ranked
+        by cosine similarity between the question's embedding and each
+        table's name and column names. The full schema is returned when the
+        database has no more than schema_top_k tables, when a schema override
+        is set, or if the embedding call fails.
+        
+        Args:
+            question: Natural language question
+            
+        Returns:
+            Schema text for the schema_top_k most relevant tables
+        """
+        schema = self.get_schema()
+        if self._schema_override is not None or self._schema_top_k <= 0:
+            return schema
+        tables = sorted(self.db.get_usable_table_names())
+        if len(tables) <= self._schema_top_k:
+            return schema
+        
+        try:
+            names, matrix = self._get_table_embeddings(tables)
+            embedding = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        except Exception as e:
+            if self.verbose:
+                print(f"Table ranking failed, using the full schema: {str(e)}")
+            return schema
+        embedding /= np.linalg.norm(embedding) or 1.0
+        
+        top = np.argsort(matrix @ embedding)[::-1][:self._schema_top_k]
+        selected = [names[i] for i in top]
+        if self.verbose:
+            print(f"Tables relevant to the question: {', '.join(selected)}")
+        return self._get_table_info(selected)
+    
+    def _get_table_info(self, tables: List[str]) -> str:
+        """
+        Return the schema text for some tables, reading each table from the
+        database only the first time it is needed under the current schema.
+        """
+        version, infos = self._table_info
+        if version != self._schema_version:
+            infos = {}
+            self._table_info = (self._schema_version, infos)
+        for table in tables:
+            if table not in infos:
+                infos[table] = self.db.get_table_info(table_names=[table])
+        return "\n\n".join(infos[table] for table in sorted(tables))
+    
+    def _get_table_embeddings(self, tables: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Return the table names and a matrix of their normalized embeddings,
+        embedding them on first use and again after a schema change.
+        """
+        cached = self._table_embeddings
+        if cached is not None and cached[0] == self._schema_version:
+            return cached[1], cached[2]
+        
+        inspector = inspect(self.engine)
+        documents = [
+            f"{table} {' '.join(column['name'] for column in inspector.get_columns(table))}"
+            for table in tables
+        ]
+        matrix = np.asarray(self.embeddings.embed_documents(documents), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        self._table_embeddings = (self._schema_version, tables, matrix)
+        return tables, matrix
+    
+    def run_query(self, query: str, dtype_backend: Optional[str] = None) -> pd.DataFrame:
         """
         Execute a raw SQL query and return results as DataFrame.
         
         Args:
             query: SQL query to execute
+            dtype_backend: "pyarrow" for Arrow-backed columns
             
         Returns:
             DataFrame with query results
         """
         if self.verbose:
             print(f"Executing SQL query: {query}")
+            count = next(self._query_count)
+            if count % POOL_STATUS_INTERVAL == 0:
+                print(f"Connection pool after {count} queries: {self.engine.pool.status()}")
             
         try:
+            if self._adbc_connect is not None:
+                return self._fetch_arrow(query, dtype_backend)
             with self.engine.connect() as conn:
-                return pd.read_sql_query(text(query), conn)
+                return fetch_dataframe(conn, query, dtype_backend)
         except Exception as e:
             if self.verbose:
                 print(f"Error executing query: {str(e)}")
             raise
     
+    def run_generated_query(self, query: str, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+        """
+        Run SQL written by the LLM, after checking that it is a single
+        read-only query.
+        
+        Args:
+            query: SQL query to execute
+            dtype_backend: "pyarrow" for Arrow-backed columns
+            
+        Returns:
+            DataFrame with query results
+            
+        Raises:
+            UnsafeQueryError: If the SQL is not a single read-only query
+        """
+        check_read_only(query, self._sqlglot_dialect)
+        return self.run_query(query, dtype_backend)
+    
+    def run_query_iter(self, query: str, batch_size: int = 10_000,
+                       dtype_backend: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Execute a raw SQL query and yield its results in DataFrames of at most
+        batch_size rows. Rows are fetched through a server-side cursor where
+        the driver supports one, so the full result is never held in memory.
+        The connection is returned to the pool once the generator is
+        exhausted or closed.
+        
+        Args:
+            query: SQL query to execute
+            batch_size: Maximum number of rows per DataFrame
+            dtype_backend: "pyarrow" for Arrow-backed columns
+            
+        Returns:
+            Iterator of DataFrames; a single empty DataFrame if there are no rows
+        """
+        if self.verbose:
+            print(f"Executing SQL query in batches of {batch_size}: {query}")
+        
+        with self.engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, yield_per=batch_size, no_parameters=True
+            ).exec_driver_sql(query)
+            columns = list(result.keys())
+            empty = True
+            for rows in result.partitions(batch_size):
+                empty = False
+                df = pd.DataFrame(rows, columns=columns)
+                if dtype_backend is not None:
+                    df = df.convert_dtypes(dtype_backend=dtype_backend)
+                yield df
+            if empty:
+                yield pd.DataFrame(columns=columns)
+    
+    def _fetch_arrow(self, query: str, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+        """
+        Run a query over this thread's ADBC connection, fetching the result
+        as one Arrow table instead of row tuples.
+        """
+        conn = getattr(self._adbc_local, "conn", None)
+        if conn is None:
+            conn = self._adbc_local.conn = self._adbc_connect()
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            table = cursor.fetch_arrow_table()
+        if dtype_backend == "pyarrow":
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return table.to_pandas()
+    
+    def _run_agent(self, user_input: str) -> Tuple[str, Optional[str], Optional[Future]]:
+        """
+        Run the SQL agent, starting each query it issues on a background
+        thread so the DataFrame is fetched while the agent is still writing
+        its final answer. If the agent never runs a query itself, SQL it
+        writes in a ```sql block is started as soon as the block closes.
+        
+        Returns:
+            Tuple of (final answer, last SQL the agent ran, future for its DataFrame)
+        """
+        queries = AgentQueries(self._executor, self.run_generated_query)
+        response = ""
+        for chunk in self.agent_executor.stream({"input": user_input}, config={"callbacks": [queries.watcher]}):
+            response = queries.on_chunk(chunk, response)
+        return response, queries.sql_query, queries.pending
+    
+    async def _arun_agent(self, user_input: str) -> Tuple[str, Optional[str], Optional[Future]]:
+        """
+        Async version of _run_agent; queries still run on the executor.
+        """
+        queries = AgentQueries(self._executor, self.run_generated_query)
+        response = ""
+        async for chunk in self.agent_executor.astream({"input": user_input}, config={"callbacks": [queries.watcher]}):
+            response = queries.on_chunk(chunk, response)
+        return response, queries.sql_query, queries.pending
+    
     def process_natural_language(self, user_input: str) -> Dict[str, Any]:
         """
         Process natural language input and return query results.
         
+        Answers are cached per schema version: a repeated question (or, with
+        semantic_cache, a close paraphrase) returns the earlier result with
+        "cached" set instead of running the agent again.
+        
         Args:
             user_input: Natural language query about the database
             
         Returns:
             Dictionary with query, results, and explanation
         """
+        if self._result_cache_size <= 0:
+            return self._process_natural_language(user_input)
+        
+        key = self._result_cache_key(user_input)
+        cached, embedding = self._lookup_result(key, user_input)
+        if cached is not None:
+            return cached
+        
+        result = self._process_natural_language(user_input)
+        if result["success"] and "sql_error" not in result:
+            self._store_result(key, embedding, result)
+        return result
+    
+    async def aprocess_natural_language(self, user_input: str) -> Dict[str, Any]:
+        """
+        Async version of process_natural_language, for callers running an
+        event loop. The agent is consumed with astream and database work
+        runs on the agent's thread pool, so neither blocks the loop.
+        
+        Args:
+            user_input: Natural language query about the database
+            
+        Returns:
+            Dictionary with query, results, and explanation
+        """
+        if self._result_cache_size <= 0:
+            return await self._aprocess_natural_language(user_input)
+        
+        key = self._result_cache_key(user_input)
+        if self._semantic_cache:
+            # The semantic lookup makes an embedding call
+            loop = asyncio.get_running_loop()
+            cached, embedding = await loop.run_in_executor(None, self._lookup_result, key, user_input)
+        else:
+            cached, embedding = self._lookup_result(key, user_input)
+        if cached is not None:
+            return cached
+        
+        result = await self._aprocess_natural_language(user_input)
+        if result["success"] and "sql_error" not in result:
+            self._store_result(key, embedding, result)
+        return result
+    
+    async def arun_query(self, query: str, dtype_backend: Optional[str] = None) -> pd.DataFrame:
+        """
+        Async version of run_query. The query runs on a dedicated thread
+        pool, so the event loop keeps serving other tasks meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._conn_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._conn_semaphores.setdefault(loop, asyncio.Semaphore(self._max_connections))
+        async with semaphore:
+            return await loop.run_in_executor(self._db_pool, self.run_query, query, dtype_backend)
+    
+    def _result_cache_key(self, user_input: str) -> str:
+        """Return the result cache key for a question under the current schema."""
+        self.get_schema()  # make sure the schema version is known
+        return hashlib.blake2b(
+            f"{self._schema_version}\0{user_input}".encode(), digest_size=16
+        ).hexdigest()
+    
+    def _lookup_result(self, key: str, user_input: str) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Find a cached answer for a question, by exact key and then (with
+        semantic_cache) by embedding similarity.
+        
+        Returns:
+            The cached result (or None) and the question's embedding, which
+            the caller stores with a new entry on a miss
+        """
+        now = time.monotonic()
+        with self._result_cache_lock:
+            entry = self._result_cache.get(key)
+            if entry is not None and now - entry["created"] < self._result_cache_ttl:
+                self._result_cache.move_to_end(key)
+                return self._cached_result(entry), None
+        
+        if not self._semantic_cache:
+            return None, None
+        
+        # Embed outside the lock; it is a network call
+        embedding = np.asarray(self.embeddings.embed_query(user_input), dtype=np.float32)
+        embedding /= np.linalg.norm(embedding) or 1.0
+        
+        with self._result_cache_lock:
+            while self._emb_keys:
+                count = len(self._emb_keys)
+                scores = self._emb_matrix[:count] @ embedding
+                best = int(scores.argmax())
+                if scores[best] < self._semantic_threshold:
+                    break
+                best_key = self._emb_keys[best]
+                entry = self._result_cache[best_key]
+                if (entry["schema_version"] != self._schema_version
+                        or now - entry["created"] >= self._result_cache_ttl):
+                    # Stale; drop it and look for the next best match
+                    self._drop_result(best_key)
+                    continue
+                self._result_cache.move_to_end(best_key)
+                if self.verbose:
+                    print(f"Semantic cache hit (similarity {scores[best]:.3f})")
+                return self._cached_result(entry), embedding
+        return None, embedding
+    
+    def _cached_result(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Rebuild a result dict, with a fresh DataFrame, from a cache entry."""
+        result = dict(entry["result"], cached=True)
+        if entry["parquet"] is not None:
+            result["sql_result"] = pd.read_parquet(io.BytesIO(entry["parquet"]))
+        return result
+    
+    def _store_result(self, key: str, embedding: Optional[np.ndarray], result: Dict[str, Any]) -> None:
+        """Cache a successful result, evicting the least recently used entry."""
+        stored = dict(result)
+        df = stored.pop("sql_result", None)
+        parquet = None
+        if df is not None:
+            buffer = io.BytesIO()
+            try:
+                df.to_parquet(buffer, index=False)
+            except Exception as e:
+                # E.g. duplicate column names or mixed-type object columns
+                if self.verbose:
+                    print(f"Not caching result: {str(e)}")
+                return
+            parquet = buffer.getvalue()
+        
+        entry = {
+            "created": time.monotonic(),
+            "schema_version": self._schema_version,
+            "result": stored,
+            "parquet": parquet,
+        }
+        with self._result_cache_lock:
+            self._result_cache[key] = entry
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > self._result_cache_size:
+                self._drop_result(next(iter(self._result_cache)))
+            if embedding is not None:
+                self._store_embedding(key, embedding)
+    
+    def _store_embedding(self, key: str, embedding: np.ndarray) -> None:
+        """
+        Write a question's embedding into its row of the embedding matrix,
+        appending a row for a new key. Call with the result cache lock held.
+        """
+        if self._emb_matrix is None:
+            self._emb_matrix = np.zeros((self._result_cache_size, embedding.shape[0]), dtype=np.float32)
+        row = self._emb_rows.get(key)
+        if row is None:
+            row = len(self._emb_keys)
+            self._emb_keys.append(key)
+            self._emb_rows[key] = row
+        self._emb_matrix[row] = embedding
+    
+    def _drop_result(self, key: str) -> None:
+        """
+        Remove a cached result and its embedding row. The last row is moved
+        into the freed slot, so the rows in use stay contiguous. Call with
+        the result cache lock held.
+        """
+        del self._result_cache[key]
+        row = self._emb_rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self._emb_keys) - 1
+        if row != last:
+            moved = self._emb_keys[last]
+            self._emb_matrix[row] = self._emb_matrix[last]
+            self._emb_keys[row] = moved
+            self._emb_rows[moved] = row
+        self._emb_keys.pop()
+    
+    def _process_natural_language(self, user_input: str) -> Dict[str, Any]:
+        """
+        Uncached body of process_natural_language.
+        """
         try:
-            # Run the agent to get response
-            response = self.agent_executor.run(user_input)
+            # Run the agent to get response; the SQL it executed (if any) is
+            # already being fetched in the background
+            response, sql_query, pending = self._run_agent(user_input)
             
             if self.verbose:
                 print("RAW RESPONSE:")
                 print(response)
             
-            # Extract SQL query from the response if available
-            sql_query = self._extract_sql_from_response(response)
+            # Otherwise extract SQL query from the response if available
+            if not sql_query:
+                sql_query = self._extract_sql_from_response(response)
             
             # If no SQL query was found but we have a response, try a direct prompt
             if not sql_query and response:
-                # Create a prompt template for extracting SQL
-                template = """
-                Based on the database schema below and the natural language query, 
-                generate an SQL query that would answer the question.
-                
-                Schema:
-                {schema}
-                
-                Question: {question}
-                
-                Previous analysis: {response}
-                
-                SQL Query (include only the SQL, no explanations):
-                """
-                
-                prompt = PromptTemplate(
-                    input_variables=["schema", "question", "response"],
-                    template=template,
-                )
-                
-                chain = LLMChain(llm=self.llm, prompt=prompt)
-                sql_attempt = chain.run(
-                    schema=self.get_schema(),
+                sql_attempt = self._chain(SQL_EXTRACTION_TEMPLATE).run(
+                    schema=self.relevant_schema(user_input),
                     question=user_input,
                     response=response
                 )
@@ -162,7 +1127,10 @@ class SQLAIAgent:
             # If we have a SQL query, try to execute it and add the DataFrame to the result
             if sql_query:
                 try:
-                    df_result = self.run_query(sql_query)
+                    if pending is not None:
+                        df_result = pending.result()
+                    else:
+                        df_result = self.run_generated_query(sql_query)
                     # We don't directly add the DataFrame to avoid JSON serialization issues
                     # but we'll add it to a separate field
                     result["sql_result"] = df_result
@@ -183,32 +1151,249 @@ class SQLAIAgent:
                 "explanation": f"Error processing: {user_input}"
             }
     
+    async def _aprocess_natural_language(self, user_input: str) -> Dict[str, Any]:
+        """
+        Uncached body of aprocess_natural_language.
+        """
+        try:
+            # The SQL the agent executed (if any) is already being fetched
+            response, sql_query, pending = await self._arun_agent(user_input)
+            
+            if self.verbose:
+                print("RAW RESPONSE:")
+                print(response)
+            
+            if not sql_query:
+                sql_query = self._extract_sql_from_response(response)
+            
+            # If no SQL query was found but we have a response, try a direct prompt
+            if not sql_query and response:
+                # Ranking tables makes embedding calls
+                schema = await asyncio.get_running_loop().run_in_executor(
+                    None, self.relevant_schema, user_input
+                )
+                sql_attempt = await self._chain(SQL_EXTRACTION_TEMPLATE).arun(
+                    schema=schema,
+                    question=user_input,
+                    response=response
+                )
+                if "SELECT" in sql_attempt.upper():
+                    sql_query = sql_attempt.strip()
+            
+            result = {
+                "success": True,
+                "query": sql_query,
+                "result": response,
+                "explanation": f"Processed query: {user_input}",
+                "raw_response": response
+            }
+            
+            if sql_query:
+                try:
+                    if pending is not None:
+                        result["sql_result"] = await asyncio.wrap_future(pending)
+                    else:
+                        check_read_only(sql_query, self._sqlglot_dialect)
+                        result["sql_result"] = await self.arun_query(sql_query)
+                except Exception as e:
+                    if self.verbose:
+                        print(f"Error executing extracted SQL: {str(e)}")
+                    result["sql_error"] = str(e)
+            
+            return result
+            
+        except Exception as e:
+            if self.verbose:
+                print(f"Error in aprocess_natural_language: {str(e)}")
+                
+            return {
+                "success": False,
+                "error": str(e),
+                "explanation": f"Error processing: {user_input}"
+            }
+    
+    def repair_query(self, query: str, error: str) -> Optional[str]:
+        """
+        Ask the LLM to correct a SQL query that failed to execute.
+        
+        Args:
+            query: The SQL query that failed
+            error: Error message returned by the database
+            
+        Returns:
+            Corrected SQL query, or None if the model did not return one
+        """
+        sql_attempt = self._chain(SQL_REPAIR_TEMPLATE).run(
+            schema=self.get_schema(),
+            query=query,
+            error=error
+        )
+        
+        if "SELECT" in sql_attempt.upper():
+            return sql_attempt.strip()
+        return None
+    
+    def generate_sql_batch(self, questions: List[str]) -> List[Optional[str]]:
+        """
+        Translate several natural language questions to SQL with a single
+        LLM call instead of one agent run per question.
+        
+        Args:
+            questions: Natural language queries about the database
+            
+        Returns:
+            SQL query for each question in input order (None where the model
+            did not produce one)
+        """
+        response = self._chain(SQL_BATCH_TEMPLATE).run(
+            schema=self.get_schema(),
+            questions="\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1)),
+            count=len(questions)
+        )
+        
+        if self.verbose:
+            print("RAW BATCH RESPONSE:")
+            print(response)
+        
+        return self._parse_sql_batch(response, len(questions))
+    
+    def _load_json_array(self, response: str) -> list:
+        """
+        Parse a JSON array returned by the model, or return [] if the
+        response is not one.
+        """
+        # Drop markdown fences around the JSON if the model added them
+        payload = response.strip()
+        if payload.startswith("```"):
+            payload = payload.split("\n", 1)[-1].rsplit("```", 1)[0]
+        
+        try:
+            items = json.loads(payload)
+        except ValueError:
+            return []
+        return items if isinstance(items, list) else []
+    
+    def _parse_sql_batch(self, response: str, count: int) -> List[Optional[str]]:
+        """
+        Parse the JSON array returned for a batch prompt.
+        """
+        items = self._load_json_array(response)
+        
+        queries = []
+        for i in range(count):
+            item = items[i] if i < len(items) else None
+            if isinstance(item, str) and "SELECT" in item.upper():
+                queries.append(item.strip())
+            else:
+                queries.append(None)
+        return queries
+    
+    def decompose_question(self, question: str, max_parts: int = 4) -> List[str]:
+        """
+        Split a compound question into independent sub-questions that can be
+        answered by separate SQL queries.
+        
+        Args:
+            question: Natural language query about the database
+            max_parts: Maximum number of sub-questions
+            
+        Returns:
+            The sub-questions, or [question] if it should not be split
+        """
+        response = self._chain(DECOMPOSE_TEMPLATE).run(
+            schema=self.get_schema(), question=question, max_parts=max_parts
+        )
+        
+        if self.verbose:
+            print("RAW DECOMPOSITION RESPONSE:")
+            print(response)
+        
+        parts = [item.strip() for item in self._load_json_array(response)
+                 if isinstance(item, str) and item.strip()]
+        return parts[:max_parts] or [question]
+    
+    def process_compound_question(self, user_input: str) -> Dict[str, Any]:
+        """
+        Answer a compound question by splitting it into sub-questions,
+        generating their SQL in one batch call and running the queries in
+        parallel, then summarizing the sub-results. Questions that do not
+        split are handled by process_natural_language.
+        
+        Args:
+            user_input: Natural language query about the database
+            
+        Returns:
+            Dictionary with the summary as "result" and one entry per
+            sub-question in "subresults" (each with "question", "query" and
+            either "sql_result" or "sql_error")
+        """
+        try:
+            sub_questions = self.decompose_question(user_input)
+            if len(sub_questions) == 1:
+                return self.process_natural_language(user_input)
+            
+            # Start every sub-query before waiting on any, so the wall time
+            # approaches the slowest query rather than their sum
+            queries = self.generate_sql_batch(sub_questions)
+            pending = [self._executor.submit(self.run_generated_query, query) if query else None
+                       for query in queries]
+            
+            subresults = []
+            for sub_question, query, future in zip(sub_questions, queries, pending):
+                subresult = {"question": sub_question, "query": query}
+                if future is None:
+                    subresult["sql_error"] = "No SQL query could be generated"
+                else:
+                    try:
+                        subresult["sql_result"] = future.result()
+                    except Exception as e:
+                        subresult["sql_error"] = str(e)
+                subresults.append(subresult)
+            
+            return {
+                "success": True,
+                "query": None,
+                "result": self._summarize_subresults(user_input, subresults),
+                "explanation": f"Processed query as {len(subresults)} sub-questions: {user_input}",
+                "subresults": subresults
+            }
+            
+        except Exception as e:
+            if self.verbose:
+                print(f"Error in process_compound_question: {str(e)}")
+                
+            return {
+                "success": False,
+                "error": str(e),
+                "explanation": f"Error processing: {user_input}"
+            }
+    
+    def _summarize_subresults(self, question: str, subresults: List[Dict[str, Any]],
+                              max_rows: int = 20) -> str:
+        """
+        Ask the LLM to answer the original question from the sub-results.
+        """
+        sections = []
+        for subresult in subresults:
+            df = subresult.get("sql_result")
+            if df is not None:
+                data = df.head(max_rows).to_string(index=False)
+            else:
+                data = f"(failed: {subresult.get('sql_error')})"
+            sections.append(f"{subresult['question']}\n{data}")
+        
+        return self._chain(SUMMARIZE_TEMPLATE).run(
+            question=question, results="\n\n".join(sections)
+        )
+    
     def _extract_sql_from_response(self, response: str) -> Optional[str]:
         """
         Extract SQL query from agent response if present.
         """
-        # Check for SQL code blocks
-        if "```sql" in response:
-            # Extract between SQL code blocks
-            sql_parts = response.split("```sql")
-            if len(sql_parts) > 1:
-                query_block = sql_parts[1].split("```")[0].strip()
-                return query_block
-        # Try looking for SQL without markdown formatting
-        elif "SELECT" in response.upper():
-            # Find lines containing SELECT statements
-            lines = response.split('\n')
-            for i, line in enumerate(lines):
-                if "SELECT" in line.upper():
-                    # Try to capture a complete SQL statement
-                    statement = []
-                    j = i
-                    while j < len(lines) and ";" not in lines[j]:
-                        statement.append(lines[j])
-                        j += 1
-                    if j < len(lines):
-                        statement.append(lines[j])
-                    return "\n".join(statement)
+        # A ```sql code block takes precedence over a bare statement
+        match = _SQL_BLOCK_RE.search(response) or _SELECT_RE.search(response)
+        if match:
+            return match.group(match.lastindex or 0).strip()
         return None
     
     def analyze_query(self, query: str) -> Dict[str, Any]:
@@ -221,35 +1406,34 @@ class SQLAIAgent:
         Returns:
             Dictionary with analysis results
         """
-        # Create a prompt for concise query analysis
-        template = """
-        Analyze this SQL query concisely (max 3-4 bullet points):
-        
-        {query}
-        
-        Provide only:
-        • Safety (any risks?)
-        • Performance (any optimizations?)
-        • Correctness (any logical issues?)
-        
-        Keep each point to 1-2 sentences maximum.
+        return self.analyze_queries([query])[0]
+    
+    def analyze_queries(self, queries: List[str], max_concurrency: int = 8) -> List[Dict[str, Any]]:
         """
+        Analyze several SQL queries, with up to max_concurrency LLM requests
+        in flight at once.
         
-        prompt = PromptTemplate(
-            input_variables=["query"],
-            template=template,
+        Args:
+            queries: The SQL queries to analyze
+            max_concurrency: Maximum number of concurrent LLM requests
+            
+        Returns:
+            List of analysis dictionaries, in the same order as queries
+        """
+        outputs = self._chain(ANALYZE_TEMPLATE).batch(
+            [{"query": query} for query in queries],
+            config={"max_concurrency": max_concurrency}
         )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        result = chain.run(query=query)
-        
-        return {
-            "query": query,
-            "analysis": result
-        }
+        return [
+            {"query": query, "analysis": output["text"]}
+            for query, output in zip(queries, outputs)
+        ]
 
 # Example usage
 if __name__ == "__main__":
+    # Load environment variables; as a library the module leaves .env
+    # handling to the application that imports it
+    load_dotenv()
     import google.generativeai as genai
     genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
     # Example connection to a SQLite database
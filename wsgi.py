@@ -0,0 +1,5 @@
+"""WSGI entry point for running the web interface under gunicorn."""
+from sql_ai_web_interface import app
+
+if __name__ == "__main__":
+    app.run()